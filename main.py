@@ -1,29 +1,57 @@
 # main.py
 import os
-import io
+import sys
+import time
+import queue
+import logging
+import logging.handlers
+import signal
 import asyncio
-from datetime import datetime, timedelta
-import pytz
+import io
+import tempfile
+import functools
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 import asyncpg
 import aiohttp
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 # ---------- CONFIG ----------
 DISCORD_TOKEN = os.environ.get("DISCORD_TOKEN")
 DATABASE_URL = os.environ.get("DATABASE_URL")  # Railway Postgres connection
 DEFAULT_TZ = os.environ.get("DEFAULT_TZ", "Asia/Riyadh")  # default timezone
+# grace period for an in-flight scheduler tick on shutdown; keep well under the platform's
+# stop timeout (Docker defaults to 10s before SIGKILL) so pool/session cleanup still runs
+SCHEDULER_STOP_TIMEOUT = float(os.environ.get("SCHEDULER_STOP_TIMEOUT", "5"))
 
 if not DISCORD_TOKEN or not DATABASE_URL:
     raise RuntimeError("Set DISCORD_TOKEN and DATABASE_URL environment variables")
 
-tz = pytz.timezone(DEFAULT_TZ)
+tz = ZoneInfo(DEFAULT_TZ)
+
+# ---------- Logging ----------
+# records go through a queue so the event loop never blocks on stdout; a background thread does the writes
+_log_queue: queue.Queue = queue.Queue(-1)
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+logging.getLogger().addHandler(logging.handlers.QueueHandler(_log_queue))
+logging.getLogger().setLevel(logging.INFO)
+log_listener.start()
+log = logging.getLogger("fluffybot")
 
 intents = discord.Intents.default()
 bot = commands.Bot(command_prefix="!", intents=intents)
 
 db_pool: asyncpg.pool.Pool | None = None
 http_session: aiohttp.ClientSession | None = None
+listen_conn: asyncpg.Connection | None = None
+scheduler_task: asyncio.Task | None = None
+shutdown_task: asyncio.Task | None = None
+_wake_event = asyncio.Event()
+_stopping = asyncio.Event()
 
 # ---------- DB helpers ----------
 CREATE_TABLE_SQL = """
@@ -36,14 +64,64 @@ CREATE TABLE IF NOT EXISTS schedules (
     status TEXT NOT NULL DEFAULT 'pending',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
 );
+-- set when the scheduler claims a row; lets a crashed tick's rows be reclaimed
+ALTER TABLE schedules ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE;
+-- partial indexes: only pending / in-flight rows, so the due-scan in claim_due stays a tiny range scan
+CREATE INDEX IF NOT EXISTS idx_schedules_pending_runat ON schedules(run_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_schedules_processing_claimedat ON schedules(claimed_at) WHERE status = 'processing';
+-- wake the scheduler as soon as a new schedule is inserted
+CREATE OR REPLACE FUNCTION notify_schedule_due() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('schedule_due', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS schedules_notify_due ON schedules;
+CREATE TRIGGER schedules_notify_due AFTER INSERT ON schedules
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_schedule_due();
 """
 
 async def init_db():
     global db_pool
-    db_pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=5)
+    # hot queries are fixed strings, so asyncpg's per-connection statement cache prepares each one once
+    db_pool = await asyncpg.create_pool(
+        DATABASE_URL, min_size=5, max_size=20,
+        statement_cache_size=1024, max_inactive_connection_lifetime=300,
+    )
     async with db_pool.acquire() as conn:
         await conn.execute(CREATE_TABLE_SQL)
 
+async def init_listener():
+    """Open a dedicated connection that LISTENs for new schedules (pooled connections drop listeners on release)."""
+    global listen_conn
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        await conn.add_listener("schedule_due", lambda *_: _wake_event.set())
+        # wake the scheduler if the connection drops so it reconnects on its next tick
+        conn.add_termination_listener(lambda *_: _wake_event.set())
+    except Exception:
+        await conn.close()
+        raise
+    # only publish a connection that is actually listening, so ensure_listener retries otherwise
+    listen_conn = conn
+
+async def ensure_listener():
+    """Reopen the LISTEN connection after a Postgres restart or network drop."""
+    if listen_conn is not None and not listen_conn.is_closed():
+        return
+    try:
+        await init_listener()
+        log.info("Connected schedule_due listener")
+    except Exception as e:
+        # keep polling on the idle back-off until the next tick retries
+        log.warning("Failed to connect schedule_due listener: %s", e)
+
+async def init_http():
+    global http_session
+    # keep-alive + DNS cache so repeated downloads from the Discord CDN reuse TCP/TLS
+    connector = aiohttp.TCPConnector(limit=100, limit_per_host=10, ttl_dns_cache=300, keepalive_timeout=75)
+    http_session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+
 async def add_schedule(user_id: int, run_at_utc: datetime, message: str | None, attachment_url: str | None):
     async with db_pool.acquire() as conn:
         row = await conn.fetchrow(
@@ -52,107 +130,345 @@ async def add_schedule(user_id: int, run_at_utc: datetime, message: str | None,
         )
         return row["id"]
 
-async def fetch_due(limit=20):
+CLAIM_TIMEOUT = "10 minutes"  # a claimed row not finalised by then is assumed orphaned and reclaimed
+
+CLAIM_DUE_SQL = f"""
+UPDATE schedules SET status='processing', claimed_at=now()
+WHERE id = ANY(
+    SELECT id FROM schedules
+    WHERE (status='pending' AND run_at <= now())
+       OR (status='processing' AND claimed_at < now() - interval '{CLAIM_TIMEOUT}')
+    ORDER BY run_at ASC
+    LIMIT $1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, user_id, message, attachment_url, claimed_at
+"""
+
+async def claim_due(limit=20, conn: asyncpg.Connection | None = None):
+    """
+    Atomically claim due schedules (pending -> processing) so concurrent workers don't pick the same rows.
+    Rows left in processing by a crashed or cancelled tick are reclaimed after CLAIM_TIMEOUT, so delivery
+    is at-least-once: a tick that overruns CLAIM_TIMEOUT can see its rows re-sent by another worker.
+    """
+    if conn is None:
+        async with db_pool.acquire() as conn:
+            return await claim_due(limit, conn)
+    # a single statement is already atomic; no explicit transaction (saves BEGIN/COMMIT round-trips)
+    return await conn.fetch(CLAIM_DUE_SQL, limit)
+
+async def mark_batch(results: list[tuple[int, str, datetime]], conn: asyncpg.Connection | None = None):
+    """
+    Write final statuses for a batch of (schedule_id, status, claimed_at) in one round-trip.
+    Only rows still held by that claim are updated, so a stale worker can't clobber a newer claim's result.
+    """
+    if not results:
+        return
+    if conn is None:
+        async with db_pool.acquire() as conn:
+            return await mark_batch(results, conn)
+    await conn.executemany(
+        "UPDATE schedules SET status=$2 WHERE id=$1 AND status='processing' AND claimed_at=$3",
+        results
+    )
+
+NEXT_DUE_SQL = f"""
+SELECT min(t) FROM (
+    SELECT min(run_at) AS t FROM schedules WHERE status='pending'
+    UNION ALL
+    SELECT min(claimed_at) + interval '{CLAIM_TIMEOUT}' FROM schedules WHERE status='processing'
+) due
+"""
+
+async def next_due_at(conn: asyncpg.Connection | None = None) -> datetime | None:
+    if conn is None:
+        async with db_pool.acquire() as conn:
+            return await next_due_at(conn)
+    return await conn.fetchval(NEXT_DUE_SQL)
+
+LIST_LIMIT = 15  # with LIST_FAILED_LIMIT, ~75 chars per line keeps /list under Discord's 2000-char cap
+LIST_FAILED_LIMIT = 5
+
+async def get_upcoming_schedules(limit=LIST_LIMIT):
+    """Pending/in-flight schedules, soonest first; each row carries `total` (count before the LIMIT)."""
     async with db_pool.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT * FROM schedules WHERE status='pending' AND run_at <= now() ORDER BY run_at ASC LIMIT $1",
+        return await conn.fetch(
+            "SELECT id, user_id, run_at, status, attachment_url, count(*) OVER () AS total FROM schedules "
+            "WHERE status IN ('pending', 'processing') ORDER BY run_at ASC LIMIT $1",
             limit
         )
-        return rows
-
-async def mark_sent(schedule_id: int, status="sent"):
-    async with db_pool.acquire() as conn:
-        await conn.execute("UPDATE schedules SET status=$1 WHERE id=$2", status, schedule_id)
 
-async def get_all_schedules():
+async def get_recent_failed(limit=LIST_FAILED_LIMIT):
+    """Most recent failed schedules; each row carries `total` (count before the LIMIT)."""
     async with db_pool.acquire() as conn:
-        return await conn.fetch("SELECT * FROM schedules ORDER BY run_at ASC")
+        return await conn.fetch(
+            "SELECT id, user_id, run_at, status, attachment_url, count(*) OVER () AS total FROM schedules "
+            "WHERE status = 'failed' ORDER BY run_at DESC LIMIT $1",
+            limit
+        )
 
 async def get_schedule(schedule_id: int):
     async with db_pool.acquire() as conn:
         return await conn.fetchrow("SELECT * FROM schedules WHERE id=$1", schedule_id)
 
-async def cancel_schedule(schedule_id: int):
+TRY_CANCEL_SQL = """
+WITH pre AS (SELECT id, status FROM schedules WHERE id=$1),
+upd AS (
+    UPDATE schedules s SET status='canceled'
+    FROM pre WHERE s.id = pre.id AND s.status = 'pending'
+    RETURNING s.id
+)
+SELECT pre.status AS old_status, EXISTS(SELECT 1 FROM upd) AS canceled FROM pre
+"""
+
+async def try_cancel(schedule_id: int) -> tuple[bool, str] | None:
+    """
+    Cancel a pending schedule in one round-trip.
+    Returns None if not found, else (canceled, status before the attempt).
+    """
     async with db_pool.acquire() as conn:
-        r = await conn.execute("UPDATE schedules SET status='canceled' WHERE id=$1 AND status='pending'", schedule_id)
-        return r
+        row = await conn.fetchrow(TRY_CANCEL_SQL, schedule_id)
+    if row is None:
+        return None
+    if not row["canceled"] and row["old_status"] == "pending":
+        # claimed by the scheduler between our snapshot and the UPDATE
+        return False, "processing"
+    return row["canceled"], row["old_status"]
 
 # ---------- Background scheduler ----------
-async def download_bytes(url: str) -> tuple[io.BytesIO, str]:
-    """Download file bytes and return (BytesIO, filename)"""
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1 << 20  # keep up to 1 MiB in memory, spill larger files to disk
+
+if sys.version_info >= (3, 11):
+    _SpooledFile = tempfile.SpooledTemporaryFile
+else:
+    # discord.File only treats io.IOBase instances as file objects (anything else is opened as a path) and
+    # checks readable()/seekable(); SpooledTemporaryFile only gained both in 3.11
+    class _SpooledFile(tempfile.SpooledTemporaryFile):
+        def readable(self):
+            return self._file.readable()
+
+        def seekable(self):
+            return self._file.seekable()
+
+    io.IOBase.register(_SpooledFile)
+
+def _filename_from_url(url: str) -> str:
+    # try to get filename from url
+    return url.split("?")[0].split("/")[-1] or "file"
+
+async def download_file(url: str) -> tuple[_SpooledFile, str]:
+    """Stream a file into a spooled temp file and return (file, filename)"""
     assert http_session is not None
+    tmp = _SpooledFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        async with http_session.get(url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                tmp.write(chunk)
+    except Exception:
+        tmp.close()
+        raise
+    tmp.seek(0)
+    return tmp, _filename_from_url(url)
+
+DISCORD_UPLOAD_LIMIT = 10 * 1024 * 1024  # default per-file cap for bot uploads to DMs
+
+async def download_bytes(url: str, max_size: int = DISCORD_UPLOAD_LIMIT) -> tuple[bytes, str]:
+    """Download a file into memory (refusing anything Discord would reject) and return (bytes, filename)"""
+    assert http_session is not None
+    buf = io.BytesIO()
     async with http_session.get(url) as resp:
         resp.raise_for_status()
-        data = await resp.read()
-    # try to get filename from url
-    filename = url.split("?")[0].split("/")[-1] or "file"
-    bio = io.BytesIO(data)
-    bio.seek(0)
-    return bio, filename
-
-async def process_due():
-    rows = await fetch_due(limit=30)
-    for row in rows:
-        sid = row["id"]
-        user_id = row["user_id"]
-        message = row["message"]
-        attachment_url = row["attachment_url"]
+        if resp.content_length is not None and resp.content_length > max_size:
+            raise ValueError(f"attachment is {resp.content_length} bytes, over the {max_size}-byte upload limit")
+        async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            buf.write(chunk)
+            if buf.tell() > max_size:
+                raise ValueError(f"attachment exceeds the {max_size}-byte upload limit")
+    # getvalue() hands over BytesIO's internal buffer rather than copying it
+    return buf.getvalue(), _filename_from_url(url)
+
+USER_CACHE_TTL = 3600.0  # seconds
+USER_CACHE_MAX = 1024
+_user_cache: OrderedDict[int, tuple[float, discord.User]] = OrderedDict()
+
+async def _get_user_cached(user_id: int) -> discord.User:
+    """Resolve a user from the gateway cache, then our TTL cache, and only then the REST API"""
+    user = bot.get_user(user_id)
+    if user is not None:
+        return user
+    now = time.monotonic()
+    cached = _user_cache.get(user_id)
+    if cached:
+        if now - cached[0] < USER_CACHE_TTL:
+            _user_cache.move_to_end(user_id)
+            return cached[1]
+        del _user_cache[user_id]
+    user = await bot.fetch_user(user_id)
+    _user_cache[user_id] = (now, user)
+    _user_cache.move_to_end(user_id)
+    while len(_user_cache) > USER_CACHE_MAX:
+        _user_cache.popitem(last=False)
+    return user
+
+MAX_CONCURRENT_SENDS = 8  # bound parallel DMs to stay well inside Discord rate limits
+
+class _SharedDownloads:
+    """Per-tick dedup for attachment URLs used by more than one row; unique URLs keep streaming to disk."""
+
+    def __init__(self, rows):
+        counts = Counter(r["attachment_url"] for r in rows if r["attachment_url"])
+        self._remaining = {url: n for url, n in counts.items() if n > 1}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def is_shared(self, url: str) -> bool:
+        return url in self._remaining
+
+    async def open(self, url: str) -> tuple[io.BytesIO, str]:
+        task = self._tasks.get(url)
+        if task is None:
+            task = asyncio.create_task(download_bytes(url))
+            self._tasks[url] = task
+        data, fname = await task
+        # each sender needs its own BytesIO since a shared one has a single read position;
+        # BytesIO over immutable bytes shares the buffer instead of copying it
+        return io.BytesIO(data), fname
+
+    def release(self, url: str | None):
+        """Drop the buffered bytes once the last row using this URL is done."""
+        if url not in self._remaining:
+            return
+        self._remaining[url] -= 1
+        if not self._remaining[url]:
+            del self._remaining[url]
+            self._tasks.pop(url, None)
+
+async def _deliver(row, sem: asyncio.Semaphore, downloads: _SharedDownloads) -> tuple[int, str, datetime]:
+    """Send one due schedule and return (schedule_id, final status, claimed_at)"""
+    sid = row["id"]
+    claimed_at = row["claimed_at"]
+    user_id = row["user_id"]
+    message = row["message"]
+    attachment_url = row["attachment_url"]
+    async with sem:
         try:
-            user = await bot.fetch_user(user_id)
+            user = await _get_user_cached(user_id)
             if attachment_url:
-                bio, fname = await download_bytes(attachment_url)
-                discord_file = discord.File(fp=bio, filename=fname)
-                await user.send(content=message or "", file=discord_file)
+                if downloads.is_shared(attachment_url):
+                    fp, fname = await downloads.open(attachment_url)
+                else:
+                    fp, fname = await download_file(attachment_url)
+                # discord.File doesn't close file objects it didn't open
+                with fp:
+                    await user.send(content=message or "", file=discord.File(fp=fp, filename=fname))
             else:
                 await user.send(content=message or "")
-            await mark_sent(sid, "sent")
+            return sid, "sent", claimed_at
         except Exception as e:
             # mark failed so admin can inspect (we could add retries)
-            await mark_sent(sid, "failed")
-            print(f"Failed to send schedule {sid} to {user_id}: {e}")
+            log.warning("Failed to send schedule %s to %s: %s", sid, user_id, e)
+            return sid, "failed", claimed_at
+        finally:
+            downloads.release(attachment_url)
+
+async def process_due(conn: asyncpg.Connection) -> int:
+    """Claim and deliver due schedules; returns how many were processed."""
+    rows = await claim_due(limit=30, conn=conn)
+    sem = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+    downloads = _SharedDownloads(rows)
+    results = await asyncio.gather(*(_deliver(r, sem, downloads) for r in rows))
+    await mark_batch(results, conn=conn)
+    return len(rows)
+
+MIN_IDLE_SLEEP = 1.0
+MAX_IDLE_SLEEP = 60.0  # safety net in case a NOTIFY is missed (e.g. listener reconnect)
 
-@tasks.loop(seconds=15.0)
 async def scheduler_loop():
-    if db_pool is None:
+    """Sleep until the next run_at (or an insert NOTIFY), then process what is due."""
+    backoff = MIN_IDLE_SLEEP
+    while not _stopping.is_set():
+        try:
+            # clear before processing so an insert that lands mid-tick wakes us straight away
+            _wake_event.clear()
+            await ensure_listener()
+            # one pooled connection per tick instead of one per helper call
+            async with db_pool.acquire() as conn:
+                n = await process_due(conn)
+                next_at = await next_due_at(conn)
+            # back off while ticks find nothing, snap back once there is work
+            backoff = max(MIN_IDLE_SLEEP, backoff / 2) if n else min(MAX_IDLE_SLEEP, backoff * 2)
+            if next_at is None:
+                delay = backoff
+            else:
+                delay = min(MAX_IDLE_SLEEP, (next_at - datetime.now(timezone.utc)).total_seconds())
+                if delay <= 0:
+                    # more rows already due: go again now if this tick made progress, otherwise they are
+                    # locked by another worker or our clock is ahead of the DB's, so don't spin
+                    delay = 0.0 if n else backoff
+            try:
+                await asyncio.wait_for(_wake_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("Scheduler tick failed: %s", e)
+            await asyncio.sleep(5)
+
+async def stop_scheduler():
+    """Let the current tick finish (sends + status flush), then stop; cancel only if it overruns."""
+    global scheduler_task
+    if scheduler_task is None:
         return
-    await process_due()
+    _stopping.set()
+    _wake_event.set()
+    done, _ = await asyncio.wait({scheduler_task}, timeout=SCHEDULER_STOP_TIMEOUT)
+    if not done:
+        log.warning("Scheduler tick overran shutdown grace period; cancelling")
+        scheduler_task.cancel()
+        await asyncio.gather(scheduler_task, return_exceptions=True)
+    scheduler_task = None
 
 # ---------- Utilities ----------
-def parse_time_12h_to_utc(time_str: str) -> datetime:
-    """
-    Accepts "02:30 PM" and returns a UTC-aware datetime for the next occurrence of that time in DEFAULT_TZ.
-    """
+@functools.lru_cache(maxsize=128)
+def _parse_12h(time_str: str) -> tuple[int, int]:
+    """Parse "02:30 PM" into (hour, minute); cached since users type the same few times."""
     try:
         parsed_time = datetime.strptime(time_str.strip(), "%I:%M %p").time()
     except ValueError:
         raise ValueError("Time must be in 12-hour format like '02:30 PM'")
+    return parsed_time.hour, parsed_time.minute
+
+def parse_time_12h_to_utc(time_str: str) -> datetime:
+    """
+    Accepts "02:30 PM" and returns a UTC-aware datetime for the next occurrence of that time in DEFAULT_TZ.
+    """
+    hour, minute = _parse_12h(time_str)
 
     now_local = datetime.now(tz)
-    run_local = tz.localize(datetime(now_local.year, now_local.month, now_local.day,
-                                     parsed_time.hour, parsed_time.minute))
+    run_local = datetime(now_local.year, now_local.month, now_local.day, hour, minute, tzinfo=tz)
     if run_local <= now_local:
         run_local += timedelta(days=1)
-    run_utc = run_local.astimezone(pytz.UTC)
+    run_utc = run_local.astimezone(timezone.utc)
     return run_utc
 
+_FMT = "%Y-%m-%d %I:%M %p"
+
 def pretty_time_local(utc_dt: datetime) -> str:
-    local = utc_dt.astimezone(tz)
-    return local.strftime("%Y-%m-%d %I:%M %p")
+    return utc_dt.astimezone(tz).strftime(_FMT)
 
 # ---------- Slash commands ----------
 @bot.event
 async def on_ready():
-    print(f"Logged in as {bot.user} (ID: {bot.user.id})")
+    log.info("Logged in as %s (ID: %s)", bot.user, bot.user.id)
     await bot.tree.sync()
-    # init DB and HTTP session
-    global http_session
-    if db_pool is None:
-        await init_db()
-    if http_session is None:
-        http_session = aiohttp.ClientSession()
-    if not scheduler_loop.is_running():
-        scheduler_loop.start()
-    print("Bot ready and scheduler started.")
+    global scheduler_task
+    # a failed LISTEN connect must not stop the scheduler from starting; it retries every tick
+    await ensure_listener()
+    if scheduler_task is None:
+        scheduler_task = asyncio.create_task(scheduler_loop())
+    log.info("Bot ready and scheduler started.")
 
 @bot.tree.command(name="send", description="Send an instant DM to a member (text and/or file)")
 async def slash_send(interaction: discord.Interaction, user: discord.User, message: str | None = None, file: discord.Attachment | None = None):
@@ -160,8 +476,10 @@ async def slash_send(interaction: discord.Interaction, user: discord.User, messa
     try:
         if file:
             # use attachment URL directly (download & forward)
-            bio, fname = await download_bytes(file.url)
-            await user.send(content=message or "", file=discord.File(fp=bio, filename=fname))
+            fp, fname = await download_file(file.url)
+            # discord.File doesn't close file objects it didn't open, so release the temp file ourselves
+            with fp:
+                await user.send(content=message or "", file=discord.File(fp=fp, filename=fname))
         else:
             await user.send(content=message or "")
         await interaction.followup.send(f"✅ Sent DM to {user.display_name}", ephemeral=True)
@@ -181,18 +499,30 @@ async def slash_scheduledm(interaction: discord.Interaction, user: discord.User,
     sid = await add_schedule(user.id, run_utc, message, attachment_url)
     await interaction.followup.send(f"✅ Scheduled DM **#{sid}** to {user.mention} at {pretty_time_local(run_utc)} ({DEFAULT_TZ}).", ephemeral=True)
 
-@bot.tree.command(name="list", description="List all scheduled DMs")
+def _format_schedule_lines(rows) -> str:
+    text = "\n".join(
+        f"#{r['id']}: to <@{r['user_id']}> at {pretty_time_local(r['run_at'])} — {r['status']}{' (file)' if r['attachment_url'] else ''}"
+        for r in rows
+    )
+    total = rows[0]["total"]
+    if total > len(rows):
+        text += f"\n…and {total - len(rows)} more (showing {len(rows)} of {total})"
+    return text
+
+@bot.tree.command(name="list", description="List upcoming scheduled DMs and recent failures")
 async def slash_list(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True, thinking=True)
-    rows = await get_all_schedules()
-    if not rows:
+    rows = await get_upcoming_schedules()
+    failed = await get_recent_failed()
+    if not rows and not failed:
         await interaction.followup.send("📭 No scheduled DMs.", ephemeral=True)
         return
-    lines = []
-    for r in rows:
-        lines.append(f"#{r['id']}: to <@{r['user_id']}> at {pretty_time_local(r['run_at'])} — {r['status']} {'(file)' if r['attachment_url'] else ''}")
-    text = "\n".join(lines)
-    await interaction.followup.send(f"📋 Scheduled:\n{text}", ephemeral=True)
+    sections = []
+    if rows:
+        sections.append(f"📋 Scheduled:\n{_format_schedule_lines(rows)}")
+    if failed:
+        sections.append(f"⚠️ Recently failed:\n{_format_schedule_lines(failed)}")
+    await interaction.followup.send("\n\n".join(sections), ephemeral=True)
 
 @bot.tree.command(name="get", description="Get details of a scheduled DM by ID")
 async def slash_get(interaction: discord.Interaction, id: int):
@@ -208,32 +538,53 @@ async def slash_get(interaction: discord.Interaction, id: int):
 @bot.tree.command(name="cancel", description="Cancel a scheduled DM by ID")
 async def slash_cancel(interaction: discord.Interaction, id: int):
     await interaction.response.defer(ephemeral=True, thinking=True)
-    r = await get_schedule(id)
-    if not r:
+    result = await try_cancel(id)
+    if result is None:
         await interaction.followup.send("❌ Not found", ephemeral=True)
         return
-    if r["status"] != "pending":
-        await interaction.followup.send(f"⚠️ Schedule is already {r['status']}.", ephemeral=True)
+    canceled, status = result
+    if not canceled:
+        await interaction.followup.send(f"⚠️ Schedule is already {status}.", ephemeral=True)
         return
-    await cancel_schedule(id)
     await interaction.followup.send(f"🛑 Canceled schedule #{id}.", ephemeral=True)
 
 # ---------- Shutdown cleanup ----------
 async def cleanup():
     global http_session, db_pool
+    await stop_scheduler()
+    if listen_conn:
+        await listen_conn.close()
     if http_session:
         await http_session.close()
     if db_pool:
         await db_pool.close()
+    log_listener.stop()
 
-import signal
-def handle_exit():
-    print("Shutting down...")
-    asyncio.create_task(cleanup())
-    asyncio.get_event_loop().stop()
+async def shutdown():
+    # stop the scheduler before closing the client so no tick sends on a closed connection
+    await stop_scheduler()
+    await bot.close()
+
+def _request_shutdown():
+    global shutdown_task
+    if shutdown_task is not None:
+        return
+    log.info("Shutting down...")
+    # keep a reference so the task isn't garbage-collected before it runs
+    shutdown_task = asyncio.create_task(shutdown())
 
-signal.signal(signal.SIGINT, lambda *_: handle_exit())
-signal.signal(signal.SIGTERM, lambda *_: handle_exit())
+async def main():
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, _request_shutdown)
+    try:
+        # DB pool and HTTP session exist before the gateway connects, so commands never see them unset
+        await init_db()
+        await init_http()
+        async with bot:
+            await bot.start(DISCORD_TOKEN)
+    finally:
+        await cleanup()
 
 if __name__ == "__main__":
-    bot.run(DISCORD_TOKEN)
+    asyncio.run(main())